@@ -0,0 +1,1333 @@
+"""
+Word Count Pro 性能基准测试
+
+用法:
+    python benchmark.py count [--size-mb 8] [--repeat 5]
+        calculate_mixed_word_count 微基准, 并在仓库自带的 test_* 样例和
+        合成文本上校验新实现与旧实现 (findall + sub + split) 的结果完全一致
+
+    python benchmark.py encoding [--size-mb 8] [--repeat 3]
+        对比全量 chardet 检测与 BOM/UTF-8 快速路径 + 采样检测的解码吞吐 (UTF-8 / GBK)
+
+    python benchmark.py docx [--files 40] [--paragraphs 400] [--repeat 3]
+        在生成的 docx 语料 (段落、表格、合并单元格、多节页眉页脚) 上对比 python-docx 引擎
+        与 xml 流式引擎的结果和耗时
+
+    python benchmark.py markdown [--files 200] [--size-kb 64] [--repeat 3]
+        Markdown 语料: 校验单次渲染 + html.parser 提取与旧实现 (markdown.markdown + 两次
+        BeautifulSoup 解析) 的字数和文本一致, 校验 GBK / Shift-JIS 编码的 .md 文件 (整体读取与流式)
+        的字数与 UTF-8 版本一致, 并对比吞吐
+
+    python benchmark.py pdf [--pages 600] [--workers 4] [--shard-pages 64]
+        长 PDF: 对比逐页提取 (旧实现, 不释放页面缓存)、逐页 close() 以及按页范围分片并行
+        三种方式的结果、耗时和峰值 RSS
+
+    python benchmark.py upload [--size-mb 64]
+        上传解析的峰值 RSS: 旧流程 (read() + 写临时文件 + 按路径解析) 对比直接解析上传流
+
+    python benchmark.py excel [--rows 100000]
+        Excel 导出: 校验只写模式与旧实现 (普通工作簿 + 逐格设置样式 + 遍历所有列算列宽)
+        的单元格值、样式和列宽一致, 并对比耗时和峰值 RSS
+
+    python benchmark.py pdf-export [--rows 1000,10000,100000] [--legacy-max-rows 10000] [--font FONT.ttf]
+        PDF 导出: 对比旧实现 (每次请求注册字体, 所有行放进一个大表格并逐行包装 Paragraph)
+        与按页分块的小表格, 给出一次性字体解析耗时、每种行数下的导出耗时、页数和峰值 RSS
+
+    python benchmark.py startup [--repeat 3] [--top 12]
+        启动耗时: 分别以延迟导入和全部预先导入 (WORD_COUNT_EAGER_IMPORTS=1) 启动 uvicorn,
+        测量从启动进程到 GET / 返回 200 的时间; 并给出 -X importtime 中耗时最高的直接依赖、
+        各延迟模块首次使用时的导入耗时, 以及打包脚本是否为所有延迟模块声明了 --hidden-import
+
+    python benchmark.py formats [--size-kb 256] [--cjk-ratio 0.5] [--formats docx,txt,pptx,...]
+        把同一段合成文本分别写成 docx / txt / pptx / xlsx / odt / epub / html / rtf, 校验每种格式
+        统计出的字数都与直接统计文本的结果一致, 并给出单文件耗时和分项数
+
+    python benchmark.py corpus OUTPUT [--files 20] [--size-kb 64] [--cjk-ratio 0.5] [--formats docx,pdf,txt,md,...]
+        生成确定性的合成语料, 供 suite --corpus 或手动测试使用
+
+    python benchmark.py suite [--files 20] [--size-kb 64] [--cjk-ratio 0.5] [--engines count,pdf,...]
+                              [--corpus DIR] [--repeat 3] [--json out.json] [--compare base.json]
+        回归基准: 每个引擎 (count / docx-python-docx / docx-xml / pdf / txt / md / pptx / xlsx /
+        odt / epub / html / rtf) 在新进程中统计语料, 输出 files/s、MB/s、单文件耗时 p50/p99 和
+        峰值 RSS; --json 保存结果, --compare 与之前保存的结果对比 (字数变化、吞吐/延迟/内存变化百分比)
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import socket
+import urllib.request
+import multiprocessing
+import tracemalloc
+from xml.sax.saxutils import escape as xml_escape
+
+# 主模块按当前目录查找 static/templates, 需先切换到仓库目录再导入
+ROOT = os.path.dirname(os.path.abspath(__file__))
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import word_count_fastapi as wc  # noqa: E402
+
+SAMPLE_FILES = ['test_utf8.txt', 'test_sample.md', 'test_sample.pdf']
+
+# ============================================================================
+# 参考实现与测试数据
+# ============================================================================
+def legacy_mixed_word_count(text):
+    """重写前的统计实现, 作为一致性校验的基准"""
+    if not text:
+        return 0
+    cjk_pattern = re.compile(r'[\u4e00-\u9fff]')
+    return len(cjk_pattern.findall(text)) + len(cjk_pattern.sub(' ', text).split())
+
+def load_sample_text(filename):
+    """读取样例文件的纯文本内容"""
+    path = os.path.join(ROOT, filename)
+    if filename.endswith('.pdf'):
+        import pdfplumber
+        with pdfplumber.open(path) as pdf:
+            return "\n".join(page.extract_text() or '' for page in pdf.pages)
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8', errors='ignore')
+
+def legacy_decode(raw_data):
+    """重写前的 TXT 解码流程: 对完整内容调用 chardet, 再依次尝试候选编码"""
+    import chardet
+    result = chardet.detect(raw_data)
+    encoding = result['encoding']
+    if not encoding or result['confidence'] < 0.5:
+        encodings_to_try = ['utf-8', 'gbk', 'gb2312', 'utf-16', 'latin-1']
+    else:
+        encodings_to_try = [encoding, 'utf-8', 'gbk']
+    for enc in encodings_to_try:
+        try:
+            return raw_data.decode(enc)
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return None
+
+def make_mixed_text(size_chars, cjk_ratio=0.5, seed=42):
+    """生成确定性的中英混合文本, 包含全角空格、标点和各种空白字符"""
+    rng = random.Random(seed)
+    latin_words = ['word', 'count', 'FastAPI', 'v2.0', 'hello-world', 'e.g.', '2024', 'x']
+    separators = [' ', ' ', ' ', '\n', '\t', '　', '，', '。', '']
+    parts = []
+    length = 0
+    while length < size_chars:
+        if rng.random() < cjk_ratio:
+            piece = ''.join(chr(rng.randint(0x4e00, 0x9fff)) for _ in range(rng.randint(1, 6)))
+        else:
+            piece = rng.choice(latin_words)
+        piece += rng.choice(separators)
+        parts.append(piece)
+        length += len(piece)
+    return ''.join(parts)
+
+# ============================================================================
+# 基准测试
+# ============================================================================
+def measure(fn, arg, repeat):
+    """返回 (结果, 最佳耗时秒数, 峰值内存字节数)"""
+    tracemalloc.start()
+    result = fn(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return result, best, peak
+
+def check_equivalence(texts, verbose=True):
+    """新旧实现结果必须逐个一致, 返回不一致的样例名列表"""
+    mismatches = []
+    for name, text in texts:
+        expected = legacy_mixed_word_count(text)
+        actual = wc.calculate_mixed_word_count(text)
+        if verbose:
+            flag = 'OK' if expected == actual else 'MISMATCH'
+            print(f"  {name:<24} legacy={expected:<10} new={actual:<10} {flag}")
+        if expected != actual:
+            mismatches.append(name)
+    return mismatches
+
+def run_count(args):
+    large = make_mixed_text(int(args.size_mb * 1024 * 1024 / 2))
+    texts = [(name, load_sample_text(name)) for name in SAMPLE_FILES]
+    texts.append((f'synthetic-{args.size_mb:g}MB', large))
+
+    print("一致性校验:")
+    mismatches = check_equivalence(texts)
+
+    # 随机短文本 + 极小的统计窗口, 覆盖跨窗口边界的单词
+    rng = random.Random(7)
+    fuzz = [(f'fuzz-{i}', make_mixed_text(rng.randint(0, 400), rng.random(), seed=i)) for i in range(300)]
+    window = wc.COUNT_WINDOW_CHARS
+    try:
+        for size in (1, 7, 64):
+            wc.COUNT_WINDOW_CHARS = size
+            mismatches += check_equivalence(fuzz, verbose=False)
+    finally:
+        wc.COUNT_WINDOW_CHARS = window
+    print(f"  {'fuzz (window 1/7/64)':<24} {len(fuzz) * 3} cases")
+
+    if mismatches:
+        print(f"发现 {len(mismatches)} 个不一致的样例: {mismatches[:10]}")
+        return 1
+
+    size_mb = len(large.encode('utf-8')) / 1024 / 1024
+    print(f"\n性能 ({size_mb:.1f} MB 文本, 取 {args.repeat} 次最佳):")
+    for label, fn in (('legacy', legacy_mixed_word_count), ('single-pass', wc.calculate_mixed_word_count)):
+        _, best, peak = measure(fn, large, args.repeat)
+        print(f"  {label:<12} {best * 1000:8.1f} ms  {size_mb / best:8.1f} MB/s  peak {peak / 1024 / 1024:7.2f} MB")
+    return 0
+
+def run_encoding(args):
+    text = make_mixed_text(int(args.size_mb * 1024 * 1024 / 2), cjk_ratio=0.6)
+    samples = [
+        ('utf-8', text.encode('utf-8')),
+        ('gbk', text.encode('gbk', errors='ignore')),
+    ]
+
+    print(f"编码检测 + 解码吞吐 (取 {args.repeat} 次最佳):")
+    for name, raw_data in samples:
+        size_mb = len(raw_data) / 1024 / 1024
+        for label, fn in (('legacy', legacy_decode), ('sampled', wc.decode_text)):
+            best = float('inf')
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                decoded = fn(raw_data)
+                best = min(best, time.perf_counter() - started)
+            info = {}
+            wc.decode_text(raw_data, info)
+            path = info.get('encoding_method') if label == 'sampled' else 'chardet-full'
+            ok = 'OK' if decoded == legacy_decode(raw_data) else 'MISMATCH'
+            print(f"  {name:<6} {size_mb:6.1f} MB  {label:<8} {best * 1000:9.1f} ms "
+                  f"{size_mb / best:9.1f} MB/s  path={path:<12} {ok}")
+
+    # 端到端: 通过 get_txt_word_count 统计落盘文件
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, raw_data in samples:
+            path = os.path.join(temp_dir, f'{name}.txt')
+            with open(path, 'wb') as f:
+                f.write(raw_data)
+            info = {}
+            started = time.perf_counter()
+            char_count, status = wc.get_txt_word_count(path, info)
+            elapsed = time.perf_counter() - started
+            print(f"  get_txt_word_count({name}): {char_count} {status} "
+                  f"encoding={info.get('encoding')} path={info.get('encoding_method')} {elapsed * 1000:.1f} ms")
+    return 0
+
+def make_docx_corpus(directory, files, paragraphs, seed=42):
+    """
+    生成 docx 语料, 返回 [(路径, 是否含预期差异)]
+    一半文件包含合并单元格和沿用上一节的页脚: python-docx 会重复统计这些文本,
+    两个引擎的结果预期不同; 其余文件两个引擎的结果必须一致
+    """
+    import docx
+    from docx.enum.section import WD_SECTION
+
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(files):
+        merged = i % 2 == 1
+        document = docx.Document()
+        section = document.sections[0]
+        section.header.paragraphs[0].text = make_mixed_text(40, seed=rng.random())
+        section.footer.paragraphs[0].text = f"第 {i} 页 footer"
+        for _ in range(paragraphs):
+            document.add_paragraph(make_mixed_text(rng.randint(20, 200), seed=rng.random()))
+
+        table = document.add_table(rows=4, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = make_mixed_text(rng.randint(5, 30), seed=rng.random())
+        if merged:
+            table.cell(0, 0).merge(table.cell(0, 2))
+            table.cell(1, 0).merge(table.cell(3, 0))
+
+        # 第二节使用独立的页眉; 含差异的文件中页脚沿用上一节 (python-docx 对每一节重复统计)
+        second = document.add_section(WD_SECTION.NEW_PAGE)
+        second.header.is_linked_to_previous = False
+        second.header.paragraphs[0].text = "第二节 header"
+        if not merged:
+            second.footer.is_linked_to_previous = False
+            second.footer.paragraphs[0].text = "第二节 footer"
+        document.add_paragraph(make_mixed_text(100, seed=rng.random()))
+
+        path = os.path.join(directory, f'corpus_{i:03d}.docx')
+        document.save(path)
+        corpus.append((path, merged))
+    return corpus
+
+def run_docx(args):
+    engines = (('python-docx', wc.get_word_count), ('xml', wc.get_docx_xml_word_count))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus = make_docx_corpus(temp_dir, args.files, args.paragraphs)
+        total_mb = sum(os.path.getsize(path) for path, _ in corpus) / 1024 / 1024
+
+        print(f"结果校验 ({len(corpus)} 个文件, 合并单元格/沿用页脚的文件差异属预期):")
+        unexpected = []
+        for path, merged in corpus:
+            counts = [fn(path) for _, fn in engines]
+            same = counts[0] == counts[1]
+            if not same and not merged:
+                unexpected.append(os.path.basename(path))
+            if not same or args.verbose:
+                print(f"  {os.path.basename(path):<16} python-docx={counts[0][0]:<8} xml={counts[1][0]:<8} "
+                      f"{'OK' if same else ('expected' if merged else 'MISMATCH')}")
+        print(f"  {len(corpus) - len(unexpected)} / {len(corpus)} 个文件符合预期")
+
+        print(f"\n性能 ({total_mb:.1f} MB docx, 取 {args.repeat} 次最佳):")
+        for label, fn in engines:
+            best = float('inf')
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                for path, _ in corpus:
+                    fn(path)
+                best = min(best, time.perf_counter() - started)
+            print(f"  {label:<12} {best * 1000:9.1f} ms  {len(corpus) / best:8.1f} files/s")
+
+    if unexpected:
+        print(f"发现 {len(unexpected)} 个不一致的文件: {unexpected[:10]}")
+        return 1
+    return 0
+
+def legacy_md_text(md_content):
+    """重写前的 Markdown 纯文本提取: 渲染后用 BeautifulSoup 解析两次"""
+    import markdown
+    from bs4 import BeautifulSoup
+    html = markdown.markdown(md_content)
+    soup = BeautifulSoup(html, 'html.parser')
+    text_content = soup.get_text()
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.get_text()
+
+# 覆盖 Markdown 常见语法以及内嵌 HTML 的边界情况 (注释、脚本、ruby、实体、CDATA、未闭合标签)
+MARKDOWN_SNIPPETS = [
+    "# 标题 {words}\n",
+    "## Section {words}\n",
+    "{words} *emphasis* **strong {words}** `code`\n",
+    "- item {words}\n- item [link](http://example.com) {words}\n",
+    "1. first {words}\n2. second\n",
+    "> quote {words}\n",
+    "```python\nprint('{words}')\n\n# not a heading\n```\n",
+    "    indented code {words}\n",
+    "| a | b |\n|---|---|\n| {words} | x |\n",
+    "<div class=\"note\">{words}<!-- hidden {words} --></div>\n",
+    "<script>var x = '{words}';</script>\n",
+    "<style>.a {{ color: red }}</style>\n",
+    "<ruby>漢<rp>(</rp><rt>kan</rt></ruby> {words}\n",
+    "Tom &amp; Jerry &copy; &#20320;&#x597D; &nbsp;{words} &unknown;\n",
+    "<p>unclosed <b>bold {words}\n",
+    "Setext heading {words}\n---------------\n",
+    "![image](a.png) {words}<br>{words}<hr/>\n",
+    "[ref link][r1] {words}\n\n[r1]: http://example.com\n",
+    "<![CDATA[cdata {words}]]>\n",
+]
+
+def make_markdown_doc(size_chars, seed, cjk_ratio=0.5):
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size_chars:
+        words = make_mixed_text(rng.randint(5, 80), cjk_ratio, seed=rng.random()).replace('\n', ' ')
+        part = rng.choice(MARKDOWN_SNIPPETS).format(words=words) + '\n'
+        parts.append(part)
+        length += len(part)
+    return ''.join(parts)
+
+# 非 UTF-8 的 Markdown 样例: (名称, 文本, 编码); 短文件上 chardet 置信度低, 最先尝试的是 UTF-8
+MARKDOWN_ENCODING_SAMPLES = [
+    ('test_sample.md', None, 'gbk'),
+    ('short-gbk', '你好世界，这是一个测试文件。', 'gbk'),
+    ('short-sjis', 'これは日本語のテストです。', 'shift_jis'),
+]
+
+def check_markdown_encodings():
+    """非 UTF-8 编码的 Markdown 文件经整体读取和流式两条路径统计, 字数都应与 UTF-8 版本一致"""
+    mismatches = []
+    threshold = wc.TEXT_STREAM_THRESHOLD
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, text, encoding in MARKDOWN_ENCODING_SAMPLES:
+            text = text if text is not None else load_sample_text(name)
+            expected = wc.calculate_mixed_word_count(wc.extract_markdown_text(text))
+            path = os.path.join(temp_dir, f'{name}.{encoding}.md')
+            with open(path, 'wb') as f:
+                f.write(text.encode(encoding))
+            counts = []
+            try:
+                for wc.TEXT_STREAM_THRESHOLD in (threshold, 0):
+                    info = {}
+                    counts.append((wc.get_md_word_count(path, info)[0], info.get('encoding')))
+            finally:
+                wc.TEXT_STREAM_THRESHOLD = threshold
+            ok = all(count == expected for count, _ in counts)
+            print(f"  {name:<16} {encoding:<10} expected={expected:<6} "
+                  f"whole={counts[0][0]} ({counts[0][1]}) stream={counts[1][0]} ({counts[1][1]}) "
+                  f"{'OK' if ok else 'MISMATCH'}")
+            if not ok:
+                mismatches.append(f'{name}.{encoding}')
+    return mismatches
+
+def run_markdown(args):
+    docs = [('test_sample.md', load_sample_text('test_sample.md'))]
+    docs += [(f'gen-{i}', make_markdown_doc(args.size_kb * 1024 // 2, seed=i)) for i in range(args.files)]
+
+    # BeautifulSoup 会把纯空白字符串折叠为单个空格/换行, 并去掉未知实体 (如 &foo;) 的分号,
+    # 两者都不影响字数; 比较文本时忽略这两类差异
+    def normalize(text):
+        return ' '.join(text.replace(';', '').split())
+
+    print(f"一致性校验 ({len(docs)} 个文档):")
+    mismatches = []
+    for name, md_content in docs:
+        expected = legacy_md_text(md_content)
+        actual = wc.extract_markdown_text(md_content)
+        expected_count = wc.calculate_mixed_word_count(expected)
+        actual_count = wc.calculate_mixed_word_count(actual)
+        if expected_count != actual_count or normalize(expected) != normalize(actual):
+            mismatches.append(name)
+            print(f"  {name:<16} MISMATCH legacy={expected_count} new={actual_count}")
+    print(f"  {len(docs) - len(mismatches)} / {len(docs)} 个文档的字数与文本一致")
+
+    print("\n编码检测 (非 UTF-8 文件):")
+    mismatches += check_markdown_encodings()
+
+    size_mb = sum(len(md_content.encode('utf-8')) for _, md_content in docs) / 1024 / 1024
+    print(f"\n性能 ({size_mb:.1f} MB Markdown, 取 {args.repeat} 次最佳):")
+    for label, fn in (('legacy', legacy_md_text), ('html.parser', wc.extract_markdown_text)):
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for _, md_content in docs:
+                wc.calculate_mixed_word_count(fn(md_content))
+            best = min(best, time.perf_counter() - started)
+        print(f"  {label:<12} {best * 1000:9.1f} ms  {size_mb / best:7.2f} MB/s")
+
+    # 渲染本身的耗时, 即两种实现共同的下限
+    import markdown
+    started = time.perf_counter()
+    for _, md_content in docs:
+        markdown.markdown(md_content)
+    print(f"  {'render only':<12} {(time.perf_counter() - started) * 1000:9.1f} ms")
+    return 1 if mismatches else 0
+
+def legacy_pdf_word_count(file_path):
+    """重写前的 PDF 统计实现: 拼接全部页面文本后统计, 页面缓存直到关闭文档才释放"""
+    import pdfplumber
+    full_text = []
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text()
+            if text:
+                full_text.append(text)
+    return wc.calculate_mixed_word_count("\n".join(full_text)), "成功"
+
+def make_long_pdf(path, pages, seed=42):
+    """用 reportlab 生成多页纯文本 PDF (英文内容, 不依赖中文字体)"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(seed)
+    words = ['report', 'quarterly', 'revenue', 'growth', 'analysis', 'FastAPI', '2024', 'v2.0', 'e.g.']
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for _ in range(pages):
+        text = pdf.beginText(40, 800)
+        text.setFont('Helvetica', 9)
+        for _ in range(70):
+            text.textLine(' '.join(rng.choice(words) for _ in range(14)))
+        pdf.drawText(text)
+        pdf.showPage()
+    pdf.save()
+
+def _measure_pdf(mode, path, workers, shard_pages, queue):
+    """在独立子进程中统计 PDF, 回传 (结果, 耗时, 峰值 RSS)"""
+    started = time.perf_counter()
+    if mode == 'legacy':
+        result = legacy_pdf_word_count(path)
+    elif mode == 'page-close':
+        result = wc.get_pdf_word_count(path)
+    else:
+        wc.PDF_SHARD_MIN_BYTES = 0
+        wc.PDF_SHARD_PAGES = shard_pages
+        try:
+            result = wc.count_files_parallel([path], max_workers=workers)[0][:2]
+        finally:
+            # 等待共享进程池退出, 否则 multiprocessing 子进程退出时会一直等待工作进程
+            wc.cpu_executor.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+    # 分片模式只测量调度进程; 每个工作进程同一时刻只处理一个分片中的一页
+    queue.put((result, elapsed, _read_rss_mb('VmHWM')))
+
+def run_pdf(args):
+    if _read_rss_mb('VmHWM') is None:
+        print("当前平台不支持读取 /proc/self/status, 无法测量峰值 RSS")
+        return 1
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'long.pdf')
+        make_long_pdf(path, args.pages)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"{args.pages} 页 PDF ({size_mb:.1f} MB), 分片大小 {args.shard_pages} 页, "
+              f"{args.workers} 个工作进程, 每种方式在新进程中运行:")
+
+        counts = set()
+        for mode in ('legacy', 'page-close', 'sharded'):
+            queue = context.Queue()
+            process = context.Process(target=_measure_pdf, args=(mode, path, args.workers, args.shard_pages, queue))
+            process.start()
+            result, elapsed, peak = queue.get()
+            process.join()
+            counts.add(result)
+            print(f"  {mode:<11} count={result[0]:<9} {elapsed:7.2f} s  peak RSS={peak:7.1f} MB")
+    if len(counts) != 1:
+        print(f"结果不一致: {counts}")
+        return 1
+    return 0
+
+def _read_rss_mb(field):
+    """读取 /proc/self/status 中的内存字段 (MB), 不可用时返回 None
+
+    VmHWM 按地址空间统计, exec 后重新计数; ru_maxrss 在 Linux 上会继承 fork 前
+    父进程的峰值, 不适合在 spawn 子进程中测量。
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _measure_upload(mode, source_path, filename, queue):
+    """在独立子进程中模拟一次上传解析, 回传 (结果, 解析前峰值 RSS, 解析后峰值 RSS)"""
+    import shutil
+    # 与 Starlette 一致: 上传内容先进入 SpooledTemporaryFile
+    spooled = tempfile.SpooledTemporaryFile(max_size=wc.UPLOAD_SPOOL_BYTES)
+    with open(source_path, 'rb') as f:
+        shutil.copyfileobj(f, spooled)
+    spooled.seek(0)
+    before = _read_rss_mb('VmHWM')
+
+    if mode == 'legacy':
+        temp_dir = tempfile.mkdtemp()
+        try:
+            content = spooled.read()
+            file_path = os.path.join(temp_dir, filename)
+            with open(file_path, 'wb') as f:
+                f.write(content)
+            result = wc.get_word_count_unified(file_path)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    else:
+        result = wc.get_word_count_unified(spooled, filename=filename)
+    queue.put((result, before, _read_rss_mb('VmHWM')))
+
+def run_upload(args):
+    if _read_rss_mb('VmHWM') is None:
+        print("当前平台不支持读取 /proc/self/status, 无法测量峰值 RSS")
+        return 1
+    context = multiprocessing.get_context('spawn')
+    text = make_mixed_text(int(args.size_mb * 1024 * 1024 / 2))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cases = []
+        for filename in ('upload.txt', 'upload.md'):
+            path = os.path.join(temp_dir, filename)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            cases.append((filename, path))
+
+        print(f"上传解析峰值 RSS (每次在新进程中运行, 文件 {os.path.getsize(cases[0][1]) / 1024 / 1024:.1f} MB):")
+        for filename, path in cases:
+            for mode in ('legacy', 'stream'):
+                queue = context.Queue()
+                process = context.Process(target=_measure_upload, args=(mode, path, filename, queue))
+                started = time.perf_counter()
+                process.start()
+                result, before, peak = queue.get()
+                process.join()
+                elapsed = time.perf_counter() - started
+                print(f"  {filename:<11} {mode:<7} count={result[0]:<9} "
+                      f"peak before={before:7.1f} MB  peak={peak:7.1f} MB  "
+                      f"delta={peak - before:7.1f} MB  {elapsed:6.2f} s")
+    return 0
+
+def legacy_build_excel_report(results):
+    """重写前的 Excel 导出: 普通工作簿, 逐个单元格设置样式, 再遍历所有列计算列宽"""
+    import io
+    import openpyxl
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+
+    output = io.BytesIO()
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "字数统计报告"
+    ws.append(wc.EXCEL_HEADERS)
+    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    for cell in ws[1]:
+        cell.font = Font(bold=True, color="FFFFFF", size=12)
+        cell.fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+        cell.border = thin_border
+    for row in results:
+        ws.append([row['filename'], row['file_type'], row['char_count'], row['status']])
+    for row in ws.iter_rows(min_row=2, max_row=len(results) + 1):
+        for cell in row:
+            cell.alignment = Alignment(vertical="center")
+            cell.border = thin_border
+            if isinstance(cell.value, int):
+                cell.alignment = Alignment(horizontal="right", vertical="center")
+    for column_cells in ws.columns:
+        length = max(len(str(cell.value)) for cell in column_cells)
+        ws.column_dimensions[column_cells[0].column_letter].width = length * 1.2 + 2
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def make_export_results(rows, seed=42):
+    rng = random.Random(seed)
+    return [{
+        'filename': f"项目/{rng.choice(['草稿', 'final', '章节'])}_{i:06d}.{rng.choice(['docx', 'pdf', 'md', 'txt'])}",
+        'file_type': '.docx',
+        'char_count': rng.randint(0, 200000),
+        'status': '成功' if rng.random() > 0.02 else '失败: 无法识别文件编码',
+    } for i in range(rows)]
+
+def _excel_cell_styles(path):
+    """读取导出文件的所有单元格 (值 + 样式), 用于新旧实现的一致性比较"""
+    import openpyxl
+    sheet = openpyxl.load_workbook(path).active
+    cells = [
+        (cell.value, cell.number_format) + tuple(
+            getattr(cell, name)._StyleProxy__target for name in ('font', 'fill', 'alignment', 'border')
+        )
+        for row in sheet.iter_rows() for cell in row
+    ]
+    widths = [sheet.column_dimensions[letter].width for letter in 'ABCD']
+    return sheet.title, cells, widths
+
+def _measure_excel(mode, rows, queue):
+    """在独立子进程中生成一次报表, 回传 (耗时, 文件大小, 峰值 RSS)"""
+    results = make_export_results(rows)
+    before = _read_rss_mb('VmHWM')
+    started = time.perf_counter()
+    output = legacy_build_excel_report(results) if mode == 'legacy' else wc.build_excel_report(results)
+    elapsed = time.perf_counter() - started
+    size = output.seek(0, 2)
+    queue.put((elapsed, size, before, _read_rss_mb('VmHWM')))
+
+def run_excel(args):
+    sample = make_export_results(500)
+    if _excel_cell_styles(legacy_build_excel_report(sample)) != _excel_cell_styles(wc.build_excel_report(sample)):
+        print("新旧实现导出的单元格值、样式或列宽不一致")
+        return 1
+    print("500 行样本: 新旧实现的单元格值、样式和列宽一致")
+
+    if _read_rss_mb('VmHWM') is None:
+        print("当前平台不支持读取 /proc/self/status, 无法测量峰值 RSS")
+        return 1
+    context = multiprocessing.get_context('spawn')
+    print(f"{args.rows} 行导出 (每种方式在新进程中运行):")
+    for mode in ('legacy', 'write-only'):
+        queue = context.Queue()
+        process = context.Process(target=_measure_excel, args=(mode, args.rows, queue))
+        process.start()
+        elapsed, size, before, peak = queue.get()
+        process.join()
+        print(f"  {mode:<10} {elapsed:7.2f} s  {size / 1024 / 1024:6.2f} MB  "
+              f"peak RSS={peak:7.1f} MB  delta={peak - before:7.1f} MB")
+    return 0
+
+def legacy_build_pdf_report(results, font_name, font_path=None):
+    """
+    重写前的 PDF 导出: 每次请求都解析并注册字体文件、重建段落和表格样式,
+    所有行放进一个大表格, 每个文件名都包装成 Paragraph; font_path 为空时使用已注册的字体
+    """
+    import io
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    output = io.BytesIO()
+    doc = SimpleDocTemplate(output, pagesize=A4)
+    if font_path:
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('TitleStyle', parent=styles['Heading1'], fontName=font_name, fontSize=18,
+                                 alignment=1, spaceAfter=20)
+    normal_style = ParagraphStyle('NormalStyle', parent=styles['Normal'], fontName=font_name, fontSize=10)
+    elements = [Paragraph("文档字数统计报告", title_style)]
+    table_data = [["文件名", "文件类型", "字符数", "状态"]]
+    total_chars = 0
+    for row in results:
+        table_data.append([Paragraph(row['filename'], normal_style), row['file_type'], str(row['char_count']),
+                           row['status']])
+        total_chars += row['char_count']
+    table = Table(table_data, colWidths=[250, 60, 80, 80])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4F81BD")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+    elements += [table, Spacer(1, 20), Paragraph(f"总文件数: {len(results)}", normal_style),
+                 Paragraph(f"总字符数: {total_chars}", normal_style)]
+    doc.build(elements)
+    output.seek(0)
+    return output
+
+def _pdf_page_count(output):
+    output.seek(0)
+    return len(re.findall(rb'/Type /Page\b', output.read()))
+
+def _measure_pdf_export(mode, rows, font, queue):
+    """在独立子进程中生成一次 PDF 报表, 回传 (耗时, 文件大小, 页数, 峰值 RSS); 字体解析不计入耗时"""
+    if font:
+        wc.PDF_FONT_PATH = font
+    template = wc.get_pdf_template()
+    font_path = template.font_source if os.path.isfile(template.font_source) else None
+    results = make_export_results(rows)
+    before = _read_rss_mb('VmHWM')
+    started = time.perf_counter()
+    if mode == 'legacy':
+        output = legacy_build_pdf_report(results, template.font_name, font_path)
+    else:
+        output = wc.build_pdf_report(results)
+    elapsed = time.perf_counter() - started
+    size = output.seek(0, 2)
+    queue.put((elapsed, size, _pdf_page_count(output), before, _read_rss_mb('VmHWM')))
+
+def run_pdf_export(args):
+    if args.font:
+        wc.PDF_FONT_PATH = args.font
+    started = time.perf_counter()
+    template = wc.get_pdf_template()
+    resolve_seconds = time.perf_counter() - started
+    print(f"字体: {template.font_name} ({template.font_source}), 一次性解析注册 {resolve_seconds:.3f} s")
+    if not os.path.isfile(template.font_source):
+        print("  (内置 CID 字体, 旧流程不含解析字体文件的开销; 用 --font 指定 TrueType 字体可计入)")
+
+    if _read_rss_mb('VmHWM') is None:
+        print("当前平台不支持读取 /proc/self/status, 无法测量峰值 RSS")
+        return 1
+    context = multiprocessing.get_context('spawn')
+    for rows in args.rows:
+        print(f"{rows} 行导出 (每种方式在新进程中运行):")
+        for mode in ('legacy', 'chunked'):
+            if mode == 'legacy' and rows > args.legacy_max_rows:
+                print(f"  {mode:<8} 跳过 (超过 --legacy-max-rows {args.legacy_max_rows})")
+                continue
+            queue = context.Queue()
+            process = context.Process(target=_measure_pdf_export, args=(mode, rows, args.font, queue))
+            process.start()
+            elapsed, size, pages, before, peak = queue.get()
+            process.join()
+            print(f"  {mode:<8} {elapsed:8.2f} s  {pages:6d} 页  {size / 1024 / 1024:6.2f} MB  "
+                  f"peak RSS={peak:7.1f} MB  delta={peak - before:7.1f} MB")
+    return 0
+
+PACKAGING_SCRIPTS = ('打包Mac应用.sh', '打包Windows应用.bat', os.path.join('.github', 'workflows', 'build.yml'))
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _measure_startup(eager, data_dir, timeout=60):
+    """启动 uvicorn 子进程, 返回从启动到 GET / 返回 200 的秒数"""
+    port = _free_port()
+    env = dict(os.environ,
+               WORD_COUNT_EAGER_IMPORTS='1' if eager else '0',
+               WORD_COUNT_JOBS_PATH=os.path.join(data_dir, 'jobs.db'),
+               WORD_COUNT_CACHE_PATH=os.path.join(data_dir, 'cache.db'))
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'word_count_fastapi:app', '--port', str(port), '--log-level', 'warning'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError('服务在超时时间内未就绪')
+    finally:
+        process.terminate()
+        process.wait()
+
+def _parse_importtime(stderr, top):
+    """解析 -X importtime 输出, 返回 (模块总耗时, 耗时最高的直接依赖 [(累计秒数, 模块名)])"""
+    total = 0.0
+    direct = []
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)', line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)) / 1e6, len(match.group(3)), match.group(4)
+        # 子模块先于父模块输出: 上一个顶层模块之后、word_count_fastapi 之前的二级模块才是它的直接依赖
+        if indent == 0:
+            if name == 'word_count_fastapi':
+                total = cumulative
+                break
+            direct = []
+        elif indent == 2:
+            direct.append((cumulative, name))
+    direct.sort(reverse=True)
+    return total, direct[:top]
+
+_LAZY_COST_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import word_count_fastapi as wc
+costs = []
+for module in wc.LAZY_MODULES.values():
+    started = time.perf_counter()
+    module.load()
+    costs.append((module.feature, module.name, time.perf_counter() - started))
+print(json.dumps(costs))
+"""
+
+def run_startup(args):
+    with tempfile.TemporaryDirectory() as data_dir:
+        for eager in (True, False):
+            label = 'eager' if eager else 'lazy'
+            timings = [_measure_startup(eager, data_dir) for _ in range(args.repeat)]
+            print(f"  {label:<6} 启动到 GET / 返回: min={min(timings):.3f} s  mean={sum(timings) / len(timings):.3f} s")
+
+    env = dict(os.environ, WORD_COUNT_EAGER_IMPORTS='0')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import word_count_fastapi'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    total, direct = _parse_importtime(result.stderr, args.top)
+    print(f"导入 word_count_fastapi (延迟导入): {total:.3f} s, 耗时最高的直接依赖:")
+    for cumulative, name in direct:
+        print(f"  {cumulative * 1000:8.1f} ms  {name}")
+
+    result = subprocess.run([sys.executable, '-c', _LAZY_COST_SCRIPT.format(root=ROOT)],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    import json
+    print("延迟模块首次使用时的导入耗时 (按注册顺序加载, 已被前面模块带入的依赖不重复计):")
+    for feature, name, seconds in json.loads(result.stdout.strip().splitlines()[-1]):
+        print(f"  {seconds * 1000:8.1f} ms  {name:<30} ({feature})")
+
+    missing = []
+    for script in PACKAGING_SCRIPTS:
+        with open(os.path.join(ROOT, script), encoding='utf-8') as f:
+            declared = set(re.findall(r'--hidden-import=([\w.]+)', f.read()))
+        missing += [f"{script}: {name}" for name in wc.LAZY_MODULES if name not in declared]
+    if missing:
+        print("打包脚本缺少 --hidden-import (PyInstaller 无法分析延迟导入):")
+        for item in missing:
+            print(f"  {item}")
+        return 1
+    print("打包脚本已为全部延迟模块声明 --hidden-import")
+    return 0
+
+# ============================================================================
+# 合成语料与基准套件
+# ============================================================================
+CORPUS_FORMATS = ('docx', 'pdf', 'txt', 'md', 'pptx', 'xlsx', 'odt', 'epub', 'html', 'rtf')
+
+# 引擎名 -> (语料格式, word_count_fastapi 中的统计函数名)
+SUITE_ENGINES = {
+    'count': ('txt', 'calculate_mixed_word_count'),
+    'docx-python-docx': ('docx', 'get_word_count'),
+    'docx-xml': ('docx', 'get_docx_xml_word_count'),
+    'pdf': ('pdf', 'get_pdf_word_count'),
+    'txt': ('txt', 'get_txt_word_count'),
+    'md': ('md', 'get_md_word_count'),
+    'pptx': ('pptx', 'get_pptx_word_count'),
+    'xlsx': ('xlsx', 'get_xlsx_word_count'),
+    'odt': ('odt', 'get_odt_word_count'),
+    'epub': ('epub', 'get_epub_word_count'),
+    'html': ('html', 'get_html_word_count'),
+    'rtf': ('rtf', 'get_rtf_word_count'),
+}
+
+def _write_corpus_pdf(path, text):
+    """用 reportlab 内置的 STSong-Light CID 字体写入中英混合文本, 无需安装字体文件"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.pdfgen import canvas
+
+    if 'STSong-Light' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+    lines = [chunk for line in text.splitlines() for chunk in (line[i:i + 50] for i in range(0, len(line), 50))]
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for start in range(0, len(lines), 60):
+        page = pdf.beginText(40, 800)
+        page.setFont('STSong-Light', 9)
+        for line in lines[start:start + 60]:
+            page.textLine(line)
+        pdf.drawText(page)
+        pdf.showPage()
+    pdf.save()
+
+_XML_NAMESPACES = {
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'office': 'urn:oasis:names:tc:opendocument:xmlns:office:1.0',
+    'text': 'urn:oasis:names:tc:opendocument:xmlns:text:1.0',
+    'table': 'urn:oasis:names:tc:opendocument:xmlns:table:1.0',
+    'style': 'urn:oasis:names:tc:opendocument:xmlns:style:1.0',
+}
+_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+
+def _xmlns(*prefixes):
+    return ' '.join(f'xmlns:{prefix}="{_XML_NAMESPACES[prefix]}"' for prefix in prefixes)
+
+def _split_parts(lines, parts):
+    """把行列表平均分成 parts 组 (幻灯片、章节等)"""
+    size = max(1, -(-len(lines) // parts))
+    return [lines[i:i + size] for i in range(0, len(lines), size)] or [[]]
+
+def _write_zip(path, parts):
+    """mimetype (EPUB/ODF) 必须是第一个部件且不压缩"""
+    import zipfile
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts:
+            archive.writestr(name, data, zipfile.ZIP_STORED if name == 'mimetype' else zipfile.ZIP_DEFLATED)
+
+def _write_corpus_pptx(path, text, slides=20):
+    """只写入统计所需的部件 (演示文稿、关系和幻灯片), 每行一个段落"""
+    parts = []
+    slide_ids = []
+    rels = []
+    for number, lines in enumerate(_split_parts(text.split('\n'), slides), 1):
+        paragraphs = ''.join(f'<a:p><a:r><a:t>{xml_escape(line)}</a:t></a:r></a:p>' for line in lines)
+        parts.append((f'ppt/slides/slide{number}.xml',
+                      f'<p:sld {_xmlns("a", "p", "r")}><p:cSld><p:spTree><p:sp><p:txBody><a:bodyPr/>'
+                      f'{paragraphs}</p:txBody></p:sp></p:spTree></p:cSld></p:sld>'))
+        slide_ids.append(f'<p:sldId id="{255 + number}" r:id="rId{number}"/>')
+        rels.append(f'<Relationship Id="rId{number}" Type="{_REL_TYPE}slide" Target="slides/slide{number}.xml"/>')
+    parts.append(('ppt/presentation.xml',
+                  f'<p:presentation {_xmlns("p", "r")}><p:sldIdLst>{"".join(slide_ids)}</p:sldIdLst></p:presentation>'))
+    parts.append(('ppt/_rels/presentation.xml.rels',
+                  '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                  f'{"".join(rels)}</Relationships>'))
+    _write_zip(path, parts)
+
+def _write_corpus_xlsx(path, text, sheets=3):
+    """openpyxl 只写模式, 每行文本一个单元格 (共享字符串), 分到多个工作表"""
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    for number, lines in enumerate(_split_parts(text.split('\n'), sheets), 1):
+        sheet = workbook.create_sheet(f'Sheet{number}')
+        for line in lines:
+            sheet.append([line or None])
+    workbook.save(path)
+
+def _write_corpus_odt(path, text):
+    """第一行写入页眉 (styles.xml), 中间约十分之一的行放进表格, 其余为正文段落"""
+    def paragraph(line):
+        return f'<text:p>{xml_escape(line).replace(chr(9), "<text:tab/>")}</text:p>'
+
+    header, *lines = text.split('\n')
+    start, end = len(lines) // 2, len(lines) // 2 + len(lines) // 10
+    rows = ''.join(f'<table:table-row><table:table-cell>{paragraph(line)}</table:table-cell></table:table-row>'
+                   for line in lines[start:end])
+    body = (''.join(paragraph(line) for line in lines[:start])
+            + f'<table:table><table:table-column/>{rows}</table:table>'
+            + ''.join(paragraph(line) for line in lines[end:]))
+    _write_zip(path, [
+        ('mimetype', 'application/vnd.oasis.opendocument.text'),
+        ('content.xml', f'<office:document-content {_xmlns("office", "text", "table")}><office:body>'
+                        f'<office:text>{body}</office:text></office:body></office:document-content>'),
+        ('styles.xml', f'<office:document-styles {_xmlns("office", "text", "style")}><office:master-styles>'
+                       f'<style:master-page style:name="Standard"><style:header>{paragraph(header)}</style:header>'
+                       '</style:master-page></office:master-styles></office:document-styles>'),
+        ('META-INF/manifest.xml',
+         '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0">'
+         '<manifest:file-entry manifest:full-path="/" manifest:media-type="application/vnd.oasis.opendocument.text"/>'
+         '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+         '<manifest:file-entry manifest:full-path="styles.xml" manifest:media-type="text/xml"/>'
+         '</manifest:manifest>'),
+    ])
+
+def _html_document(lines, title):
+    """压缩过的 HTML: 段落之间没有空白; 标题、样式和脚本中的文本不应计入字数"""
+    body = ''.join(f'<p>{xml_escape(line)}</p>' for line in lines)
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"/><title>{title}</title>'
+            f'<style>p {{ margin: 0 }}</style></head><body>{body}'
+            '<script>var notCounted = "脚本 script";</script></body></html>')
+
+def _write_corpus_epub(path, text, chapters=10):
+    parts = [
+        ('mimetype', 'application/epub+zip'),
+        ('META-INF/container.xml',
+         '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+         '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+         '</rootfiles></container>'),
+    ]
+    manifest = []
+    spine = []
+    for number, lines in enumerate(_split_parts(text.split('\n'), chapters), 1):
+        name = f'chapter {number}.xhtml'
+        parts.append((f'OEBPS/text/{name}',
+                      '<?xml version="1.0" encoding="utf-8"?>'
+                      + _html_document(lines, f'第 {number} 章').replace('<html>', '<html xmlns="http://www.w3.org/1999/xhtml">')))
+        manifest.append(f'<item id="c{number}" href="text/{name.replace(" ", "%20")}" media-type="application/xhtml+xml"/>')
+        spine.append(f'<itemref idref="c{number}"/>')
+    parts.append(('OEBPS/content.opf',
+                  '<package xmlns="http://www.idpf.org/2007/opf" version="3.0"><metadata/>'
+                  f'<manifest>{"".join(manifest)}</manifest><spine>{"".join(spine)}</spine></package>'))
+    _write_zip(path, parts)
+
+def _write_corpus_html(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(_html_document(text.split('\n'), '标题 title'))
+
+def _write_corpus_rtf(path, text):
+    """\\ansicpg936 + GBK 字体: GBK 能表示的字符写成 \\'hh, 其余写成 \\uN 加替代字符"""
+    special = {'\\': '\\\\', '{': '\\{', '}': '\\}', '\n': '\\par\n', '\t': '\\tab '}
+    out = [r'{\rtf1\ansi\ansicpg936\deff0{\fonttbl{\f0\fnil\fcharset134 SimSun;}}'
+           r'{\colortbl;\red0\green0\blue0;}{\*\generator benchmark;}\uc1\pard\plain\f0 ']
+    for ch in text:
+        if ch in special:
+            out.append(special[ch])
+        elif ord(ch) < 128:
+            out.append(ch)
+        else:
+            try:
+                out.append(''.join(f"\\'{byte:02x}" for byte in ch.encode('gbk')))
+            except UnicodeEncodeError:
+                out.append(f'\\u{ord(ch) - 65536 if ord(ch) > 32767 else ord(ch)}?')
+    out.append('}')
+    with open(path, 'w', encoding='ascii') as f:
+        f.write(''.join(out))
+
+def write_corpus_file(path, fmt, text):
+    """把文本写成 fmt 格式的文件; 除 PDF (按 50 个字符折行) 外, 各格式统计出的字数都应与原文一致"""
+    if fmt == 'docx':
+        import docx
+
+        document = docx.Document()
+        for line in text.splitlines():
+            document.add_paragraph(line)
+        document.save(path)
+    elif fmt == 'pdf':
+        _write_corpus_pdf(path, text)
+    elif fmt in CORPUS_WRITERS:
+        CORPUS_WRITERS[fmt](path, text)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+CORPUS_WRITERS = {
+    'pptx': _write_corpus_pptx,
+    'xlsx': _write_corpus_xlsx,
+    'odt': _write_corpus_odt,
+    'epub': _write_corpus_epub,
+    'html': _write_corpus_html,
+    'rtf': _write_corpus_rtf,
+}
+
+def make_corpus(directory, files, size_kb, cjk_ratio=0.5, formats=CORPUS_FORMATS, seed=42):
+    """
+    生成确定性的语料 (相同参数得到相同的文本内容), 返回 {格式: [路径]}
+    每种格式 files 个文件, 每个文件约 size_kb KB 文本, cjk_ratio 为 CJK 词块所占比例
+    """
+    corpus = {}
+    for fmt in formats:
+        paths = []
+        for i in range(files):
+            rng = random.Random(f'{seed}-{fmt}-{i}')
+            size_chars = size_kb * 1024 // 2
+            path = os.path.join(directory, f'corpus_{i:03d}.{fmt}')
+            if fmt == 'md':
+                text = make_markdown_doc(size_chars, rng.random(), cjk_ratio)
+            else:
+                text = make_mixed_text(size_chars, cjk_ratio, seed=rng.random())
+            write_corpus_file(path, fmt, text)
+            paths.append(path)
+        corpus[fmt] = paths
+    return corpus
+
+def run_formats(args):
+    """同一段文本写成各种格式, 校验统计出的字数与直接统计文本的结果完全一致, 并给出单文件耗时"""
+    formats = [fmt for fmt in args.formats if fmt not in ('pdf', 'md')]
+    text = make_mixed_text(args.size_kb * 1024 // 2, args.cjk_ratio, seed=args.seed)
+    expected = wc.calculate_mixed_word_count(text)
+    print(f"文本 {len(text)} 个字符, 期望字数 {expected}:")
+
+    mismatches = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for fmt in formats:
+            path = os.path.join(temp_dir, f'sample.{fmt}')
+            write_corpus_file(path, fmt, text)
+            handler = wc.get_format_handler(path)
+            info = {}
+            started = time.perf_counter()
+            count, status = wc.get_word_count_unified(path, info=info, breakdown=handler.breakdown)
+            elapsed = time.perf_counter() - started
+            parts = info.get('breakdown') or []
+            flag = 'OK' if count == expected and status == '成功' else 'MISMATCH'
+            print(f"  {fmt:<5} {os.path.getsize(path) / 1024:>8.0f} KB  字数 {count:<8} {elapsed * 1000:>8.1f} ms  "
+                  f"分项 {len(parts):<4} {status} {flag}")
+            if flag != 'OK':
+                mismatches.append(fmt)
+    if mismatches:
+        print(f"不一致: {', '.join(mismatches)}")
+        return 1
+    return 0
+
+def percentile(values, q):
+    """最近秩百分位数, q 取 0-100"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+def _measure_engine(engine, paths, repeat, queue):
+    """在独立子进程中运行一个引擎, 回传每个文件的耗时、总字数和峰值 RSS"""
+    fmt, fn_name = SUITE_ENGINES[engine]
+    fn = getattr(wc, fn_name)
+    if engine == 'count':
+        # 纯统计算法: 预先读入文本, 只计时 calculate_mixed_word_count
+        inputs = []
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                inputs.append(f.read())
+    else:
+        inputs = paths
+        # 解析依赖延迟导入, 先加载本格式的模块, 首个文件的耗时不含导入
+        for module in wc.LAZY_MODULES.values():
+            if module.feature == fmt:
+                module.load()
+
+    before = _read_rss_mb('VmHWM')
+    latencies = []
+    total_chars = 0
+    for _ in range(repeat):
+        total_chars = 0
+        for item in inputs:
+            started = time.perf_counter()
+            result = fn(item)
+            latencies.append(time.perf_counter() - started)
+            total_chars += result if engine == 'count' else result[0]
+    queue.put((latencies, total_chars, before, _read_rss_mb('VmHWM')))
+
+def run_engine_suite(corpus, engines, repeat):
+    """逐个引擎在 spawn 子进程中运行 (峰值 RSS 互不影响), 返回 {引擎: 指标}"""
+    context = multiprocessing.get_context('spawn')
+    report = {}
+    for engine in engines:
+        fmt = SUITE_ENGINES[engine][0]
+        paths = corpus.get(fmt)
+        if not paths:
+            continue
+        size_mb = sum(os.path.getsize(p) for p in paths) / 1024 / 1024
+        queue = context.Queue()
+        process = context.Process(target=_measure_engine, args=(engine, paths, repeat, queue))
+        process.start()
+        latencies, total_chars, before, peak = queue.get()
+        process.join()
+
+        elapsed = sum(latencies) / repeat
+        report[engine] = {
+            'format': fmt,
+            'files': len(paths),
+            'size_mb': round(size_mb, 3),
+            'total_chars': total_chars,
+            'seconds': round(elapsed, 4),
+            'files_per_sec': round(len(paths) / elapsed, 2) if elapsed else None,
+            'mb_per_sec': round(size_mb / elapsed, 3) if elapsed else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'rss_before_mb': round(before, 1) if before is not None else None,
+            'peak_rss_mb': round(peak, 1) if peak is not None else None,
+        }
+    return report
+
+def print_suite_report(report, baseline=None):
+    print(f"  {'engine':<17} {'files':>5} {'MB':>7} {'files/s':>9} {'MB/s':>8} "
+          f"{'p50 ms':>9} {'p99 ms':>9} {'peak RSS':>9}")
+    for engine, row in report.items():
+        peak = f"{row['peak_rss_mb']:.1f}" if row['peak_rss_mb'] is not None else '-'
+        print(f"  {engine:<17} {row['files']:>5} {row['size_mb']:>7.2f} {row['files_per_sec']:>9.2f} "
+              f"{row['mb_per_sec']:>8.3f} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} {peak:>9}")
+        old = (baseline or {}).get(engine)
+        if old:
+            notes = []
+            if old.get('total_chars') != row['total_chars']:
+                notes.append(f"字数变化 {old.get('total_chars')} -> {row['total_chars']}")
+            for key, label in (('mb_per_sec', 'MB/s'), ('p99_ms', 'p99'), ('peak_rss_mb', 'RSS')):
+                if old.get(key) and row.get(key) is not None:
+                    notes.append(f"{label} {(row[key] / old[key] - 1) * 100:+.1f}%")
+            print(f"  {'':<17} 对比基线: {', '.join(notes)}")
+
+def run_corpus(args):
+    os.makedirs(args.output, exist_ok=True)
+    corpus = make_corpus(args.output, args.files, args.size_kb, args.cjk_ratio, args.formats, args.seed)
+    for fmt, paths in corpus.items():
+        size_mb = sum(os.path.getsize(p) for p in paths) / 1024 / 1024
+        print(f"  {fmt:<5} {len(paths)} 个文件, {size_mb:.2f} MB")
+    return 0
+
+def run_suite(args):
+    import json
+    import platform
+
+    unknown = [e for e in args.engines if e not in SUITE_ENGINES]
+    if unknown:
+        print(f"未知引擎: {', '.join(unknown)} (可选: {', '.join(SUITE_ENGINES)})")
+        return 1
+    formats = sorted({SUITE_ENGINES[e][0] for e in args.engines})
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.corpus:
+            corpus = {fmt: sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+                                  if name.lower().endswith('.' + fmt)) for fmt in formats}
+            print(f"语料目录 {args.corpus}, 每个引擎重复 {args.repeat} 次, 各在新进程中运行:")
+        else:
+            corpus = make_corpus(temp_dir, args.files, args.size_kb, args.cjk_ratio, formats, args.seed)
+            print(f"合成语料: 每种格式 {args.files} 个文件 × {args.size_kb} KB, CJK 比例 {args.cjk_ratio}, "
+                  f"每个引擎重复 {args.repeat} 次, 各在新进程中运行:")
+        report = run_engine_suite(corpus, args.engines, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        changed = [key for key in ('corpus', 'files', 'size_kb', 'cjk_ratio', 'seed')
+                   if baseline['meta'].get(key) != getattr(args, key)]
+        if changed:
+            print(f"注意: 语料参数与基线不同 ({', '.join(changed)}), 字数和吞吐不可直接比较")
+        baseline = baseline['engines']
+    print_suite_report(report, baseline)
+
+    if args.json:
+        payload = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'corpus': args.corpus,
+                'files': args.files,
+                'size_kb': args.size_kb,
+                'cjk_ratio': args.cjk_ratio,
+                'seed': args.seed,
+                'repeat': args.repeat,
+            },
+            'engines': report,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Word Count Pro 性能基准测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    count_parser = subparsers.add_parser('count', help='calculate_mixed_word_count 微基准与一致性校验')
+    count_parser.add_argument('--size-mb', type=float, default=8, help='合成文本大小 (MB)')
+    count_parser.add_argument('--repeat', type=int, default=5, help='重复次数')
+    count_parser.set_defaults(func=run_count)
+
+    encoding_parser = subparsers.add_parser('encoding', help='编码检测快速路径的吞吐对比')
+    encoding_parser.add_argument('--size-mb', type=float, default=8, help='测试文本大小 (MB)')
+    encoding_parser.add_argument('--repeat', type=int, default=3, help='重复次数')
+    encoding_parser.set_defaults(func=run_encoding)
+
+    docx_parser = subparsers.add_parser('docx', help='DOCX 引擎一致性校验与性能对比')
+    docx_parser.add_argument('--files', type=int, default=40, help='语料文件数')
+    docx_parser.add_argument('--paragraphs', type=int, default=400, help='每个文件的段落数')
+    docx_parser.add_argument('--repeat', type=int, default=3, help='重复次数')
+    docx_parser.add_argument('--verbose', action='store_true', help='输出每个文件的结果')
+    docx_parser.set_defaults(func=run_docx)
+
+    markdown_parser = subparsers.add_parser('markdown', help='Markdown 文本提取的一致性校验与性能对比')
+    markdown_parser.add_argument('--files', type=int, default=200, help='生成的文档数')
+    markdown_parser.add_argument('--size-kb', type=int, default=64, help='每个文档的大小 (KB)')
+    markdown_parser.add_argument('--repeat', type=int, default=3, help='重复次数')
+    markdown_parser.set_defaults(func=run_markdown)
+
+    pdf_parser = subparsers.add_parser('pdf', help='长 PDF 的逐页释放与分片并行对比')
+    pdf_parser.add_argument('--pages', type=int, default=600, help='生成的 PDF 页数')
+    pdf_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='分片模式的工作进程数')
+    pdf_parser.add_argument('--shard-pages', type=int, default=wc.PDF_SHARD_PAGES, help='每个分片的页数')
+    pdf_parser.set_defaults(func=run_pdf)
+
+    upload_parser = subparsers.add_parser('upload', help='上传解析的峰值内存对比')
+    upload_parser.add_argument('--size-mb', type=float, default=64, help='模拟上传文件大小 (MB)')
+    upload_parser.set_defaults(func=run_upload)
+
+    excel_parser = subparsers.add_parser('excel', help='Excel 导出的一致性校验与耗时/内存对比')
+    excel_parser.add_argument('--rows', type=int, default=100000, help='导出行数')
+    excel_parser.set_defaults(func=run_excel)
+
+    pdf_export_parser = subparsers.add_parser('pdf-export', help='PDF 导出: 单个大表格与分页小表格的耗时/内存对比')
+    pdf_export_parser.add_argument('--rows', type=lambda v: [int(n) for n in v.split(',')], default=[1000, 10000, 100000],
+                                   help='逗号分隔的导出行数')
+    pdf_export_parser.add_argument('--legacy-max-rows', type=int, default=10000,
+                                   help='旧实现只测到该行数 (100000 行约需十余分钟)')
+    pdf_export_parser.add_argument('--font', help='TrueType 中文字体文件 (默认自动发现)')
+    pdf_export_parser.set_defaults(func=run_pdf_export)
+
+    startup_parser = subparsers.add_parser('startup', help='延迟导入与预先导入的启动耗时对比和导入耗时报告')
+    startup_parser.add_argument('--repeat', type=int, default=3, help='每种方式的启动次数')
+    startup_parser.add_argument('--top', type=int, default=12, help='列出的直接依赖数')
+    startup_parser.set_defaults(func=run_startup)
+
+    def add_corpus_arguments(sub_parser):
+        sub_parser.add_argument('--files', type=int, default=20, help='每种格式的文件数')
+        sub_parser.add_argument('--size-kb', type=int, default=64, help='每个文件的文本大小 (KB)')
+        sub_parser.add_argument('--cjk-ratio', type=float, default=0.5, help='CJK 词块所占比例 (0-1)')
+        sub_parser.add_argument('--seed', type=int, default=42, help='随机种子')
+
+    formats_parser = subparsers.add_parser('formats', help='同一文本写成各种格式后的字数一致性校验')
+    formats_parser.add_argument('--size-kb', type=int, default=256, help='文本大小 (KB)')
+    formats_parser.add_argument('--cjk-ratio', type=float, default=0.5, help='CJK 词块所占比例 (0-1)')
+    formats_parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    formats_parser.add_argument('--formats', type=lambda v: v.split(','), default=list(CORPUS_FORMATS),
+                                help='逗号分隔的格式列表 (pdf 与 md 会改变文本, 自动跳过)')
+    formats_parser.set_defaults(func=run_formats)
+
+    corpus_parser = subparsers.add_parser('corpus', help='生成确定性的多格式语料 (docx/pdf/txt/md/pptx/xlsx/odt/epub/html/rtf)')
+    corpus_parser.add_argument('output', help='输出目录')
+    add_corpus_arguments(corpus_parser)
+    corpus_parser.add_argument('--formats', type=lambda v: v.split(','), default=list(CORPUS_FORMATS),
+                               help='逗号分隔的格式列表')
+    corpus_parser.set_defaults(func=run_corpus)
+
+    suite_parser = subparsers.add_parser('suite', help='各统计引擎的吞吐、延迟分位数和峰值 RSS')
+    add_corpus_arguments(suite_parser)
+    suite_parser.add_argument('--corpus', help='使用已有语料目录 (默认生成临时语料)')
+    suite_parser.add_argument('--engines', type=lambda v: v.split(','), default=list(SUITE_ENGINES),
+                              help=f"逗号分隔的引擎列表: {','.join(SUITE_ENGINES)}")
+    suite_parser.add_argument('--repeat', type=int, default=3, help='重复次数')
+    suite_parser.add_argument('--json', help='把结果写入 JSON 文件')
+    suite_parser.add_argument('--compare', help='与之前 --json 输出的结果对比')
+    suite_parser.set_defaults(func=run_suite)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,10 @@ const { createApp, ref, computed } = Vue;
 createApp({
     setup() {
         const results = ref([]);
+        // 服务器暂存的结果集 ID (每个上传批次一个); 导出时引用 ID, 不再回传整个结果列表
+        // 列表被本地修改 (删除行、批次失败) 后 ID 不再与表格一致, 改为提交结果行
+        let resultIds = [];
+        let resultIdsValid = true;
         const loading = ref(false);
         const error = ref(null);
         const docWarning = ref(null);
@@ -24,20 +28,49 @@ createApp({
 
         // 批次上传配置
         const BATCH_SIZE = 150;
+        const UPLOAD_CONCURRENCY = 3; // 同时在途的批次数
+        const UPLOAD_MAX_RETRIES = 3; // 服务器繁忙 (503) 时的重试次数
         const FILTER_CHUNK_SIZE = 1000; // 每批过滤的文件数
 
-        const filterTypes = [
+        // 支持的格式来自服务器的格式注册表 (/api/formats), 新增格式无需修改前端
+        const formats = ref([]);
+        const loadFormats = async () => {
+            try {
+                const response = await fetch('/api/formats');
+                if (response.ok) {
+                    formats.value = (await response.json()).formats;
+                }
+            } catch (err) {
+                console.error('加载支持的格式失败:', err);
+            }
+        };
+        const formatsReady = loadFormats();
+
+        // 扩展名 -> 格式
+        const formatByExtension = computed(() => {
+            const map = new Map();
+            for (const format of formats.value) {
+                for (const ext of format.extensions) {
+                    map.set(ext, format);
+                }
+            }
+            return map;
+        });
+
+        const supportedExtensionsText = computed(() => [...formatByExtension.value.keys()].join(', '));
+
+        // 每种格式一个筛选项, 取值为该格式的第一个扩展名 (导出时服务器按同一规则筛选)
+        const filterTypes = computed(() => [
             { label: '全部', value: 'all' },
-            { label: 'Markdown', value: '.md' },
-            { label: 'Text', value: '.txt' },
-            { label: 'PDF', value: '.pdf' },
-            { label: 'Word', value: '.docx' }
-        ];
+            ...formats.value.map(format => ({ label: format.label, value: format.extensions[0] }))
+        ]);
 
         const filteredResults = computed(() => {
             let res = results.value;
             if (currentFilter.value !== 'all') {
-                res = res.filter(file => file.file_type === currentFilter.value);
+                const format = formatByExtension.value.get(currentFilter.value);
+                const extensions = format ? format.extensions : [currentFilter.value];
+                res = res.filter(file => extensions.includes(file.file_type));
             }
 
             if (sortOrder.value) {
@@ -82,7 +115,8 @@ createApp({
         // 异步过滤文件 - 分批处理避免阻塞UI
         // 同时检测是否有 .doc 文件并收集文件名
         const filterFilesAsync = async (fileList) => {
-            const supportedExtensions = new Set(['.docx', '.pdf', '.txt', '.md']);
+            await formatsReady;
+            const supportedExtensions = formatByExtension.value;
             const allFiles = Array.isArray(fileList) ? fileList : Array.from(fileList);
             const validFiles = [];
             const docFiles = [];  // 收集 .doc 文件名
@@ -104,12 +138,15 @@ createApp({
                     const fileName = file.name.toLowerCase();
                     const ext = '.' + fileName.split('.').pop();
 
-                    // 收集 .doc 文件名
-                    if (ext === '.doc') {
+                    // 格式列表加载失败时不在前端过滤, 由服务器筛选
+                    const supported = supportedExtensions.size === 0 || supportedExtensions.has(ext);
+
+                    // 收集不支持的 .doc 文件名
+                    if (ext === '.doc' && !supported) {
                         docFiles.push(file.name);
                     }
 
-                    if (supportedExtensions.has(ext) && !file.name.startsWith('~$')) {
+                    if (supported && !file.name.startsWith('~$')) {
                         validFiles.push(file);
                     }
                 }
@@ -245,9 +282,36 @@ createApp({
             }
         };
 
+        // 逐行读取 NDJSON 响应, 每解析出一个事件就回调一次
+        const readResultStream = async (response, onEvent) => {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (line.trim()) {
+                        onEvent(JSON.parse(line));
+                    }
+                }
+            }
+
+            if (buffer.trim()) {
+                onEvent(JSON.parse(buffer));
+            }
+        };
+
         const uploadFiles = async (validFiles, append = false) => {
             if (!validFiles || validFiles.length === 0) {
-                error.value = '请选择包含支持格式 (.docx, .pdf, .txt, .md) 的文件';
+                error.value = supportedExtensionsText.value
+                    ? `请选择包含支持格式 (${supportedExtensionsText.value}) 的文件`
+                    : '请选择包含支持格式的文件';
                 loading.value = false;
                 return;
             }
@@ -255,8 +319,57 @@ createApp({
             // loading已经在handleFileSelect/handleDrop中设置
             if (!append) {
                 results.value = []; // 清空之前的结果
+                resultIds = [];
+                resultIdsValid = true;
             }
 
+            const resultOffset = results.value.length;
+            const batchResults = [];
+            const batchResultIds = [];
+            const controller = new AbortController();
+
+            // 上传并统计一个批次 - 流式接口每统计完一个文件返回一行 JSON
+            const uploadBatch = async (i) => {
+                const batch = validFiles.slice(i * BATCH_SIZE, (i + 1) * BATCH_SIZE);
+                const formData = new FormData();
+                batch.forEach(file => {
+                    formData.append('files[]', file);
+                });
+
+                let response;
+                for (let attempt = 0; ; attempt++) {
+                    response = await fetch('/api/analyze_upload_stream', {
+                        method: 'POST',
+                        body: formData,
+                        signal: controller.signal
+                    });
+                    // 服务器繁忙 (503) 时按 Retry-After 等待后重试
+                    if (response.status !== 503 || attempt >= UPLOAD_MAX_RETRIES) break;
+                    const retryAfter = Number(response.headers.get('Retry-After')) || 1;
+                    await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+                }
+
+                if (!response.ok) {
+                    const data = await response.json().catch(() => ({}));
+                    throw new Error(data.detail || `第 ${i + 1} 批次上传失败`);
+                }
+
+                batchResults[i] = [];
+                await readResultStream(response, (event) => {
+                    if (event.type === 'result') {
+                        // 逐行追加, 表格随结果实时增长
+                        results.value.push(event.result);
+                        batchResults[i].push(event.result);
+                        uploadProgress.value.currentFiles += 1;
+                    } else if (event.type === 'summary') {
+                        batchResultIds[i] = event.result_id;
+                    } else if (event.type === 'error') {
+                        throw new Error(event.detail);
+                    }
+                });
+                uploadProgress.value.current += 1;
+            };
+
             try {
                 // 计算批次数量
                 const totalBatches = Math.ceil(validFiles.length / BATCH_SIZE);
@@ -267,41 +380,37 @@ createApp({
                     totalFiles: validFiles.length
                 };
 
-                // 分批上传
-                for (let i = 0; i < totalBatches; i++) {
-                    const start = i * BATCH_SIZE;
-                    const end = Math.min(start + BATCH_SIZE, validFiles.length);
-                    const batch = validFiles.slice(start, end);
-
-                    uploadProgress.value.current = i + 1;
-
-                    // 创建当前批次的 FormData
-                    const formData = new FormData();
-                    batch.forEach(file => {
-                        formData.append('files[]', file);
-                    });
-
-                    // 上传当前批次
-                    const response = await fetch('/api/analyze_upload', {
-                        method: 'POST',
-                        body: formData
-                    });
-
-                    const data = await response.json();
-
-                    if (!response.ok) {
-                        throw new Error(data.error || `第 ${i + 1} 批次上传失败`);
+                // 分批上传: 最多 UPLOAD_CONCURRENCY 个批次同时在途,
+                // 服务器解析前一批时后一批已在上传
+                let nextBatch = 0;
+                const runLane = async () => {
+                    while (nextBatch < totalBatches) {
+                        await uploadBatch(nextBatch++);
                     }
-
-                    // 合并结果
-                    results.value = [...results.value, ...data.results];
-                    uploadProgress.value.currentFiles = results.value.length;
-                }
+                };
+                const lanes = Array.from({ length: Math.min(UPLOAD_CONCURRENCY, totalBatches) }, runLane);
+                await Promise.all(lanes).catch((err) => {
+                    // 任一批次失败时取消其余在途请求
+                    controller.abort();
+                    throw err;
+                });
 
             } catch (err) {
                 error.value = err.message;
                 // 即使部分失败，也保留已成功上传的结果
             } finally {
+                // 批次并发完成, 结果按批次顺序重排, 批次内按文件名排序, 与非流式接口的顺序保持一致
+                const ordered = batchResults.flatMap(rows => (rows || []).slice()
+                    .sort((a, b) => (a.filename < b.filename ? -1 : a.filename > b.filename ? 1 : 0)));
+                results.value = results.value.slice(0, resultOffset).concat(ordered);
+                // 批次 ID 顺序与上面的结果顺序一致
+                for (let b = 0; b < batchResults.length; b++) {
+                    if (batchResultIds[b]) {
+                        resultIds.push(batchResultIds[b]);
+                    } else if (batchResults[b] && batchResults[b].length > 0) {
+                        resultIdsValid = false;
+                    }
+                }
                 loading.value = false;
                 uploadProgress.value = {
                     current: 0,
@@ -315,61 +424,50 @@ createApp({
             }
         };
 
-        const exportExcel = async () => {
-            if (filteredResults.value.length === 0) return;
-
-            try {
-                const response = await fetch('/api/export/excel', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({ results: filteredResults.value })
-                });
-
-                if (!response.ok) {
-                    throw new Error('导出 Excel 失败');
-                }
-
-                const blob = await response.blob();
-                const url = window.URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = '字数统计报告.xlsx';
-                document.body.appendChild(a);
-                a.click();
-                window.URL.revokeObjectURL(url);
-                a.remove();
-
-            } catch (err) {
-                error.value = err.message;
+        // 导出请求体: 优先引用服务器暂存的结果 (筛选和排序由服务器按相同规则完成)
+        const exportPayload = (useStored) => {
+            if (useStored) {
+                return {
+                    result_ids: resultIds,
+                    file_type: currentFilter.value === 'all' ? null : currentFilter.value,
+                    sort: sortOrder.value
+                };
             }
+            return { results: filteredResults.value };
         };
 
-        const exportPDF = async () => {
+        const downloadReport = async (url, filename, failMessage) => {
             if (filteredResults.value.length === 0) return;
 
             try {
-                const response = await fetch('/api/export/pdf', {
+                const postExport = (useStored) => fetch(url, {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json'
                     },
-                    body: JSON.stringify({ results: filteredResults.value })
+                    body: JSON.stringify(exportPayload(useStored))
                 });
 
+                const useStored = resultIdsValid && resultIds.length > 0;
+                let response = await postExport(useStored);
+                if (useStored && response.status === 404) {
+                    // 暂存结果已过期, 改为提交结果行
+                    resultIdsValid = false;
+                    response = await postExport(false);
+                }
+
                 if (!response.ok) {
-                    throw new Error('导出 PDF 失败');
+                    throw new Error(failMessage);
                 }
 
                 const blob = await response.blob();
-                const url = window.URL.createObjectURL(blob);
+                const blobUrl = window.URL.createObjectURL(blob);
                 const a = document.createElement('a');
-                a.href = url;
-                a.download = '字数统计报告.pdf';
+                a.href = blobUrl;
+                a.download = filename;
                 document.body.appendChild(a);
                 a.click();
-                window.URL.revokeObjectURL(url);
+                window.URL.revokeObjectURL(blobUrl);
                 a.remove();
 
             } catch (err) {
@@ -377,6 +475,10 @@ createApp({
             }
         };
 
+        const exportExcel = () => downloadReport('/api/export/excel', '字数统计报告.xlsx', '导出 Excel 失败');
+
+        const exportPDF = () => downloadReport('/api/export/pdf', '字数统计报告.pdf', '导出 PDF 失败');
+
         // 显示 .doc 文件警告
         const showDocWarning = (docFiles) => {
             docWarning.value = {
@@ -391,6 +493,8 @@ createApp({
 
         const reset = () => {
             results.value = [];
+            resultIds = [];
+            resultIdsValid = true;
             error.value = null;
             docWarning.value = null;
             currentFilter.value = 'all';
@@ -398,16 +502,13 @@ createApp({
 
         const removeFile = (fileToRemove) => {
             results.value = results.value.filter(file => file !== fileToRemove);
+            resultIdsValid = false;
         };
 
         const getFileTypeClass = (type) => {
-            switch (type) {
-                case '.docx': return 'bg-blue-100 text-blue-700';
-                case '.pdf': return 'bg-red-100 text-red-700';
-                case '.txt': return 'bg-gray-100 text-gray-700';
-                case '.md': return 'bg-indigo-100 text-indigo-700';
-                default: return 'bg-gray-100 text-gray-700';
-            }
+            const format = formatByExtension.value.get(type);
+            const color = format ? format.color : 'gray';
+            return `bg-${color}-100 text-${color}-700`;
         };
 
         return {
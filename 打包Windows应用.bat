@@ -65,6 +65,21 @@ pyinstaller ^
     --hidden-import=PyPDF2 ^
     --hidden-import=openpyxl ^
     --hidden-import=reportlab ^
+    --hidden-import=pdfplumber ^
+    --hidden-import=pdfminer.pdftypes ^
+    --hidden-import=chardet ^
+    --hidden-import=markdown ^
+    --hidden-import=openpyxl.styles ^
+    --hidden-import=openpyxl.styles.fonts ^
+    --hidden-import=openpyxl.cell ^
+    --hidden-import=openpyxl.utils ^
+    --hidden-import=reportlab.lib.colors ^
+    --hidden-import=reportlab.lib.pagesizes ^
+    --hidden-import=reportlab.platypus ^
+    --hidden-import=reportlab.lib.styles ^
+    --hidden-import=reportlab.pdfbase.pdfmetrics ^
+    --hidden-import=reportlab.pdfbase.ttfonts ^
+    --hidden-import=reportlab.pdfbase.cidfonts ^
     word_count_fastapi.py
 
 REM 检查打包结果